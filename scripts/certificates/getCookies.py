@@ -1,4 +1,4 @@
-import json
+import orjson
 import logging
 import requests
 import uuid
@@ -92,8 +92,8 @@ def get_tokens(output_dir: str = None):
         
         # Save cookies to the specified directory
         cookies_path = output_path / '.cookies.json'
-        with open(cookies_path, 'w') as f:
-            json.dump(cookies, f, indent=4)
+        with open(cookies_path, 'wb') as f:
+            f.write(orjson.dumps(cookies, option=orjson.OPT_INDENT_2))
             
         # Save important headers
         headers_to_save = {
@@ -105,8 +105,8 @@ def get_tokens(output_dir: str = None):
         
         # Save headers to the specified directory
         headers_path = output_path / '.headers.json'
-        with open(headers_path, 'w') as f:
-            json.dump(headers_to_save, f, indent=4)
+        with open(headers_path, 'wb') as f:
+            f.write(orjson.dumps(headers_to_save, option=orjson.OPT_INDENT_2))
             
         logger.debug(f"\nSuccessfully saved cookies to {cookies_path}")
         logger.debug(f"Headers saved to {headers_path}")
@@ -0,0 +1,15 @@
+import ast
+import orjson
+
+def load_gwt_payload(data_parts: str):
+    """Decode the literal array of a GWT-RPC response with orjson, falling back to Python literal syntax"""
+    try:
+        return orjson.loads(data_parts)
+    except orjson.JSONDecodeError:
+        return ast.literal_eval(data_parts)
+
+def parse_gwt_response(body: bytes):
+    """Decode the GWT-RPC payload that follows the //OK sentinel of a raw response"""
+    # The sentinel is ASCII, so partition the raw bytes on it and decode only the payload
+    _, _, data_parts = body.partition(b'//OK')
+    return load_gwt_payload(data_parts.strip().decode('utf-8'))
@@ -1,11 +1,12 @@
 import logging
-import json
+import orjson
+import os
 import sys
 import argparse
 from pathlib import Path
-from typing import Set
+from typing import Iterable, Set
 from getCookies import get_tokens
-from scraper import CBFCScraper
+from scraper import CBFCScraper, FETCH_WORKERS
 from parse import CBFCParser
 
 # Configure logging
@@ -16,6 +17,11 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Completed IDs are appended to the log after every batch and compacted into the JSON file
+# at the end of each scraping run
+COMPLETED_FILE = Path('.completed.json')
+COMPLETED_LOG = Path('.completed.log')
+
 def load_completed_ids() -> Set[str]:
     """
     Load the set of certificate IDs that have already been processed.
@@ -23,37 +29,58 @@ def load_completed_ids() -> Set[str]:
     Returns:
         Set of completed certificate IDs
     """
-    completed_file = Path('.completed.json')
-    if completed_file.exists():
+    completed_ids = set()
+    if COMPLETED_FILE.exists():
         try:
-            with open(completed_file, 'r') as f:
-                return set(json.load(f))
+            with open(COMPLETED_FILE, 'rb') as f:
+                completed_ids = set(orjson.loads(f.read()))
         except Exception as e:
             logger.error(f"Error loading completed IDs: {str(e)}")
-            return set()
-    else:
-        # Create the file with an empty array if it doesn't exist
-        save_completed_ids(set())
-        return set()
+    if COMPLETED_LOG.exists():
+        try:
+            with open(COMPLETED_LOG, 'r') as f:
+                completed_ids.update(line.strip() for line in f if line.strip())
+        except Exception as e:
+            logger.error(f"Error loading completed IDs log: {str(e)}")
+    if not COMPLETED_FILE.exists():
+        # Create the file if it doesn't exist, folding in any IDs from an unfinished run
+        save_completed_ids(completed_ids)
+    return completed_ids
+
+def append_completed_ids(certificate_ids: Iterable[str]) -> None:
+    """
+    Append newly completed certificate IDs to the log, one per line.
+    
+    Args:
+        certificate_ids: Certificate IDs completed since the last append
+    """
+    try:
+        with open(COMPLETED_LOG, 'a') as f:
+            f.write(''.join(f"{certificate_id}\n" for certificate_id in certificate_ids))
+    except Exception as e:
+        logger.error(f"Error appending completed IDs: {str(e)}")
 
 def save_completed_ids(completed_ids: Set[str]) -> None:
     """
-    Save the set of completed certificate IDs to a JSON file.
+    Save the set of completed certificate IDs to a JSON file and remove the append-only log.
     
     Args:
         completed_ids: Set of completed certificate IDs
     """
-    completed_file = Path('.completed.json')
     # Create parent directories if they don't exist
-    completed_file.parent.mkdir(parents=True, exist_ok=True)
+    COMPLETED_FILE.parent.mkdir(parents=True, exist_ok=True)
     
     try:
-        with open(completed_file, 'w') as f:
-            json.dump(list(sorted(completed_ids)), f)
+        # Write to a temporary file and rename it so an interrupted write never truncates the JSON
+        tmp_file = COMPLETED_FILE.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(sorted(completed_ids)))
+        os.replace(tmp_file, COMPLETED_FILE)
+        COMPLETED_LOG.unlink(missing_ok=True)
     except Exception as e:
         logger.error(f"Error saving completed IDs: {str(e)}")
 
-def process_region_year(scraper: CBFCScraper, region: int, year: int, max_seq: int = 100000, max_failures: int = 5) -> Set[str]:
+def process_region_year(scraper: CBFCScraper, region: int, year: int, completed_ids: Set[str], max_seq: int = 100000, max_failures: int = 5) -> Set[str]:
     """
     Process certificates for a specific region and year with early termination.
     
@@ -61,6 +88,7 @@ def process_region_year(scraper: CBFCScraper, region: int, year: int, max_seq: i
         scraper: The scraper instance
         region: Region code (1-9)
         year: Year to process
+        completed_ids: Set of already processed IDs, updated in place with new valid IDs
         max_seq: Maximum sequence number to try
         max_failures: Number of consecutive failures before terminating
     
@@ -68,48 +96,32 @@ def process_region_year(scraper: CBFCScraper, region: int, year: int, max_seq: i
         Set of valid certificate IDs
     """
     year_code = year + 900  # Convert year to required format
+    id_prefix = f"1000{region}0{year_code}"
     consecutive_failures = 0
     
-    # Load already processed IDs
-    completed_ids = load_completed_ids()
-    logger.debug(f"Loaded {len(completed_ids)} already processed IDs")
-    
-    # Process in batches for efficiency
+    # Process in batches for efficiency, tracking (sequence number, certificate ID) pairs
     batch_size = 10
     current_batch = []
     
     for seq in range(1, max_seq + 1):
-        certificate_id = f"1000{region}0{year_code}{seq:08d}"
+        certificate_id = f"{id_prefix}{seq:08d}"
         
         # Skip if this ID has already been processed
         if certificate_id in completed_ids:
             logger.debug(f"Skipping already processed ID: {certificate_id}")
             continue
             
-        current_batch.append(certificate_id)
+        current_batch.append((seq, certificate_id))
         
         # Process when batch is full or we've reached the max sequence
         if len(current_batch) >= batch_size or seq == max_seq:
 
-            # Check which IDs were actually valid by examining the HTML files
-            valid_ids = set()
-            for cert_id in current_batch:
-                # Use scraper's method to check if HTML exists and is valid
-                html_exists, _ = scraper.html_exists_and_valid(cert_id)
-                
-                # Fetch certificate if it doesn't exist locally
-                if not html_exists:
-                    logger.debug(f"Fetching certificate ID: {cert_id}")
-                    result = scraper.get_certificate_details(cert_id)
-                    if result:
-                        valid_ids.add(cert_id)
-                else:
-                    # HTML exists and is valid
-                    valid_ids.add(cert_id)
-            
+            # The scraper reuses valid HTML already on disk and reports which IDs were valid
+            valid_ids = scraper.process_certificates(cert_id for _, cert_id in current_batch)
+
             # Only mark valid IDs as completed
             completed_ids.update(valid_ids)
-            save_completed_ids(completed_ids)
+            append_completed_ids(valid_ids)
             
             # Update consecutive failures based on valid certificates
             if valid_ids:
@@ -118,9 +130,9 @@ def process_region_year(scraper: CBFCScraper, region: int, year: int, max_seq: i
                 logger.debug(f"Found {len(valid_ids)} valid certificates in batch of {len(current_batch)}")
             else:
                 # Increment consecutive failures by 1 since no valid certificates were found in this batch of 10 immediate consecutive certificates
-                if int(current_batch[-1]) - int(current_batch[0]) <= batch_size:
+                if current_batch[-1][0] - current_batch[0][0] <= batch_size:
                     consecutive_failures += 1
-                    logger.debug(f"No valid certificates found in batch ({current_batch[0]} to {current_batch[-1]})")
+                    logger.debug(f"No valid certificates found in batch ({current_batch[0][1]} to {current_batch[-1][1]})")
                     
                     # Check if we've hit the maximum failures
                     if consecutive_failures >= max_failures:
@@ -177,6 +189,7 @@ def main():
     parser.add_argument('--parse-only', action='store_true', help='Skip scraping and only parse existing HTML files')
     parser.add_argument('--skip-parse', action='store_true', help='Skip parsing after scraping')
     parser.add_argument('--generate-ids', action='store_true', help='Generate certificate IDs using region/year pattern instead of using certificates.txt')
+    parser.add_argument('--max-workers', type=int, default=FETCH_WORKERS, help=f'Number of certificates to fetch concurrently (default: {FETCH_WORKERS})')
 
     # Parse arguments
     args = parser.parse_args()
@@ -194,10 +207,14 @@ def main():
         sys.exit(1)
 
     # Initialize scraper
-    scraper = CBFCScraper()
+    scraper = CBFCScraper(max_workers=args.max_workers)
     
     valid_ids = []
     
+    # Load already processed IDs once; both ID sources skip them and record new ones
+    completed_ids = load_completed_ids()
+    logger.debug(f"Loaded {len(completed_ids)} already processed IDs")
+    
     # Check if we should generate IDs using region/year pattern or use certificates.txt
     if args.generate_ids:
         # Use existing ID generation logic
@@ -211,12 +228,12 @@ def main():
             for year in range(2025, 2024, -1):  # 2025 to 2024 in descending order
                 for region in range(1, 10):  # 1 to 9 for all regions
                     logger.info(f"Processing region {region} for year {year}")
-                    region_ids = process_region_year(scraper, region, year, args.max_seq, args.max_failures)
+                    region_ids = process_region_year(scraper, region, year, completed_ids, args.max_seq, args.max_failures)
                     valid_ids.extend(region_ids)
         elif args.region is not None and args.year is not None:
             # Process specific region and year
             logger.info(f"Processing region {args.region} for year {args.year} (max_seq={args.max_seq}, max_failures={args.max_failures})")
-            region_ids = process_region_year(scraper, args.region, args.year, args.max_seq, args.max_failures)
+            region_ids = process_region_year(scraper, args.region, args.year, completed_ids, args.max_seq, args.max_failures)
             valid_ids.extend(region_ids)
         else:
             # If only one of region or year is provided
@@ -232,14 +249,16 @@ def main():
             logger.error("No valid certificate IDs found in certificates.txt. Use --generate-ids to generate IDs instead.")
             sys.exit(1)
         
-        # Process each certificate ID from the file
-        logger.info(f"Processing {len(certificate_ids)} certificate IDs from certificates.txt")
-        for cert_id in certificate_ids:
-            logger.debug(f"Processing certificate ID: {cert_id}")
-            result = scraper.get_certificate_details(cert_id)
-            if result:
-                valid_ids.append(result)
+        # Skip IDs completed in an earlier run so a rerun only fetches new certificates
+        pending_ids = certificate_ids - completed_ids
+        logger.info(f"Processing {len(pending_ids)} certificate IDs from certificates.txt ({len(certificate_ids) - len(pending_ids)} already completed)")
+        file_ids = scraper.process_certificates(pending_ids)
+        completed_ids.update(file_ids)
+        append_completed_ids(file_ids)
+        valid_ids.extend(file_ids)
     
+    # Compact the completed IDs logged during this run into the JSON file
+    save_completed_ids(completed_ids)
     logger.debug(f"Scraping complete! Processed {len(valid_ids)} certificates.")
     
     # Parse certificates after scraping unless --skip-parse flag is set
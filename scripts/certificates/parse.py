@@ -1,12 +1,15 @@
-import json
+import orjson
 import re
 import csv
 import logging
 import pandas as pd
-from typing import Dict, Optional, Tuple, List
-from bs4 import BeautifulSoup
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, Optional, Tuple, List
+from lxml import etree, html as lxml_html
 from pathlib import Path
 import os
+from gwt import parse_gwt_response
 
 logging.basicConfig(
     level=logging.INFO,
@@ -19,22 +22,82 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Patterns used by clean_text and parse_endorsement_section
+_HTML_TAG_RE = re.compile(r'<[^>]+>')
+_CERT_NO_RE = re.compile(r'Cert No\.\s+([^\s]+)\s+Dated\s+([^\s]+)')
+_FINAL_DURATION_RE = re.compile(r'will be\s+([^\s]+)\s+MM\.SS')
+
+# Characters clean_text strips, plus an equivalent str.translate table for ASCII input
+_NON_TEXT_RE = re.compile(r'[^\w\s.,;:()\-]')
+_ASCII_NON_TEXT = {c: None for c in range(128) if _NON_TEXT_RE.match(chr(c))}
+
+# Case-insensitive keyword patterns used to classify fields in extract_main_data
+_CATEGORY_RE = re.compile(r'theatrical|video', re.IGNORECASE)
+_LANGUAGE_RE = re.compile(r'malayalam|hindi|tamil|telugu|kannada|marathi|bengali|punjabi|gujarati', re.IGNORECASE)
+_FORMAT_RE = re.compile(r'long', re.IGNORECASE)
+
+# Ordered (field, predicate) dispatch table for extract_main_data; the first matching predicate claims the item
+_MAIN_DATA_FIELDS = [
+    ('duration', lambda item: item.endswith('MM.SS')),
+    ('category', _CATEGORY_RE.search),
+    ('language', _LANGUAGE_RE.search),
+    ('format', _FORMAT_RE.search),
+    ('applicant', lambda item: '(' in item and ')' in item and len(item) > 20),
+    ('certifier', lambda item: 'E.O.' in item or 'CBFC' in item),
+    ('synopsis', lambda item: len(item) > 50),
+    ('title', lambda item: item.isupper() and len(item) < 30),
+]
+
+# Number of worker processes used to parse certificate HTML; HTML parsing is CPU-bound
+PARSE_WORKERS = os.cpu_count() or 1
+
+# Number of parsed certificates buffered before their CSV rows are written together
+CSV_BATCH_SIZE = 128
+
+# Compiled XPath queries over the credits and endorsement HTML fragments
+_CREDIT_DIVS_XPATH = etree.XPath("//div[@id='castCreditType' or @id='castCreditDescription']")
+_ENDORSEMENT_DIV_XPATH = etree.XPath("//div[@id='qr-redirect-endorsment']")
+_TABLE_ROWS_XPATH = etree.XPath("(.//table)[1]//tr")
+_ROW_CELLS_XPATH = etree.XPath(".//td")
+
+# One row of the modifications/cuts table, with fields in modifications.csv column order
+Modification = namedtuple('Modification', 'cut_no description deleted replaced inserted')
+
 class CBFCParser:
     def __init__(self):
         self.html_dir = Path('raw/html')
         self.csv_dir = Path('../../data/raw/')
         self.csv_dir.mkdir(exist_ok=True)
         
-        # Track processed files
+        # Track processed files; IDs are appended to a log while parsing and
+        # compacted into the JSON file at the end of each run
         self.processed_file = Path('.processed.json')
+        self.processed_log = Path('.processed.log')
         self.processed_ids = set()
         if self.processed_file.exists():
             try:
-                with open(self.processed_file, 'r') as f:
-                    self.processed_ids = set(json.load(f))
+                with open(self.processed_file, 'rb') as f:
+                    self.processed_ids = set(orjson.loads(f.read()))
                 logger.debug(f"Loaded {len(self.processed_ids)} previously processed IDs")
             except Exception as e:
                 logger.error(f"Error loading processed IDs: {str(e)}")
+        if self.processed_log.exists():
+            try:
+                with open(self.processed_log, 'r') as f:
+                    self.processed_ids.update(line.strip() for line in f if line.strip())
+                logger.debug(f"Loaded processed IDs from unfinished run, now {len(self.processed_ids)} IDs")
+            except Exception as e:
+                logger.error(f"Error loading processed IDs log: {str(e)}")
+        
+        # Metadata header saved before the first row that needs it is written, so the CSV
+        # header can still be extended if the run is killed before it does so itself
+        self.pending_fields_file = Path('.metadata_fields.json')
+
+    def __getstate__(self):
+        """Leave the processed ID set behind when the parser is sent to worker processes"""
+        state = self.__dict__.copy()
+        state['processed_ids'] = set()
+        return state
 
     def _sanitize_filename(self, certificate_id: str) -> str:
         """Sanitize certificate ID for use as filename by replacing problematic characters"""
@@ -52,79 +115,72 @@ class CBFCParser:
         """Clean text by removing HTML and normalizing whitespace"""
         if not text:
             return ""
-        # Remove HTML tags
-        text = re.sub(r'<[^>]+>', '', text)
+        # Remove HTML tags; text taken from the parsed tree has none, so skip the regex then
+        if '<' in text:
+            text = _HTML_TAG_RE.sub('', text)
         # Normalize whitespace
         text = ' '.join(text.split())
         # Remove special characters but keep basic punctuation
-        text = re.sub(r'[^\w\s.,;:()\-]', '', text)
+        if text.isascii():
+            text = text.translate(_ASCII_NON_TEXT)
+        else:
+            text = _NON_TEXT_RE.sub('', text)
         return text.strip()
 
-    def parse_credits_section(self, html_content: str) -> Dict:
-        """Parse the credits section using BeautifulSoup"""
+    def parse_credits_section(self, root: lxml_html.HtmlElement) -> Dict:
+        """Parse the credits section from an already parsed document"""
         credits = {}
-        if not html_content:
-            return credits
-            
-        soup = BeautifulSoup(html_content, 'html.parser')
-        credit_divs = soup.find_all('div', id='castCredit')
         
-        for div in credit_divs:
-            type_div = div.find('div', id='castCreditType')
-            desc_div = div.find('div', id='castCreditDescription')
-            
-            if type_div and desc_div:
-                role = type_div.get_text().strip().rstrip(':')
-                value = desc_div.get_text().strip()
+        # Collect type and description divs in a single document-order pass and
+        # pair each description with the type that precedes it
+        role = None
+        for div in _CREDIT_DIVS_XPATH(root):
+            if div.get('id') == 'castCreditType':
+                role = div.text_content().strip().rstrip(':')
+            elif role is not None:
+                value = div.text_content().strip()
                 credits[f'credit_{role.lower().replace(" ", "_")}'] = value
+                role = None
                 
         return credits
 
-    def parse_modifications_table(self, soup: BeautifulSoup) -> list:
+    def parse_modifications_table(self, element: lxml_html.HtmlElement) -> List[Modification]:
         """Parse the modifications/cuts table"""
         modifications = []
-        table = soup.find('table')
-        if not table:
-            return modifications
-
-        rows = table.find_all('tr')[1:]  # Skip header row
+        rows = _TABLE_ROWS_XPATH(element)[1:]  # Skip header row
         for row in rows:
-            cells = row.find_all('td')
+            cells = _ROW_CELLS_XPATH(row)
             if len(cells) == 5:
-                modification = {
-                    'cut_no': int(cells[0].get_text().strip()),
-                    'description': self.clean_text(cells[1].get_text()),
-                    'deleted': self.clean_text(cells[2].get_text()),
-                    'replaced': self.clean_text(cells[3].get_text()),
-                    'inserted': self.clean_text(cells[4].get_text())
-                }
-                modifications.append(modification)
+                modifications.append(Modification(
+                    int(cells[0].text_content().strip()),
+                    self.clean_text(cells[1].text_content()),
+                    self.clean_text(cells[2].text_content()),
+                    self.clean_text(cells[3].text_content()),
+                    self.clean_text(cells[4].text_content())
+                ))
         return modifications
 
-    def parse_endorsement_section(self, html_content: str) -> Dict:
-        """Parse the endorsement section using BeautifulSoup"""
+    def parse_endorsement_section(self, root: lxml_html.HtmlElement) -> Dict:
+        """Parse the endorsement section from an already parsed document"""
         endorsement = {}
-        if not html_content:
-            return endorsement
-            
-        soup = BeautifulSoup(html_content, 'html.parser')
-        endorsement_div = soup.find('div', id='qr-redirect-endorsment')
+        endorsement_divs = _ENDORSEMENT_DIV_XPATH(root)
         
-        if endorsement_div:
-            divs = endorsement_div.find_all('div', recursive=False)
+        if endorsement_divs:
+            endorsement_div = endorsement_divs[0]
+            divs = endorsement_div.findall('div')
             for div in divs:
-                text = self.clean_text(div.get_text())
+                text = self.clean_text(div.text_content())
                 if 'File No.' in text:
                     endorsement['file_no'] = text.split(':')[-1].strip()
                 elif 'Film Name' in text:
                     endorsement['film_name_full'] = text.split(':')[-1].strip()
                 elif 'Cert No.' in text:
-                    match = re.search(r'Cert No\.\s+([^\s]+)\s+Dated\s+([^\s]+)', text)
+                    match = _CERT_NO_RE.search(text)
                     if match:
                         endorsement['cert_no'] = match.group(1).strip()
                         endorsement['cert_date'] = match.group(2).strip()
                 elif 'Actual Duration' in text:
-                    match = re.search(r'will be\s+([^\s]+)\s+MM\.SS', text)
+                    match = _FINAL_DURATION_RE.search(text)
                     if match:
                         endorsement['final_duration'] = match.group(1).strip()
 
@@ -145,52 +201,32 @@ class CBFCParser:
         else:
             return main_info
 
-        required_fields = {
-            'certificate_id': -1,
-            'title': None,
-            'category': None,
-            'language': None,
-            'format': None,
-            'duration': None,
-            'applicant': None,
-            'certifier': None,
-            'synopsis': None
-        }
-
-        for i, item in enumerate(main_data):
+        # The certificate ID is the last element; the other fields are classified in a
+        # single pass, keeping the first match for each field and stopping once all are filled
+        main_info['certificate_id'] = main_data[-1]
+        unfilled = len(_MAIN_DATA_FIELDS)
+        for item in main_data:
             if isinstance(item, str):
-                if item.endswith('MM.SS'):
-                    required_fields['duration'] = i
-                elif any(x in item.lower() for x in ['theatrical', 'video']):
-                    required_fields['category'] = i
-                elif any(x in item.lower() for x in ['malayalam', 'hindi', 'tamil']):
-                    required_fields['language'] = i
-                elif 'long' in item.lower():
-                    required_fields['format'] = i
-                elif '(' in item and ')' in item and len(item) > 20:
-                    required_fields['applicant'] = i
-                elif 'E.O.' in item or 'CBFC' in item:
-                    required_fields['certifier'] = i
-                elif len(item) > 50:
-                    required_fields['synopsis'] = i
-                elif item.isupper() and len(item) < 30:
-                    required_fields['title'] = i
-
-        for key, index in required_fields.items():
-            if index is not None and index < len(main_data):
-                main_info[key] = main_data[index]
+                for field, matches in _MAIN_DATA_FIELDS:
+                    if matches(item):
+                        if field not in main_info:
+                            main_info[field] = item
+                            unfilled -= 1
+                        break
+                if not unfilled:
+                    break
 
         return main_info
 
-    def is_html_valid(self, html_content: str) -> bool:
-        """Check if HTML content is valid and contains necessary data"""
+    def is_html_valid(self, html_content: bytes) -> bool:
+        """Check if raw (undecoded) HTML content is valid and contains necessary data"""
         if not html_content or len(html_content) < 100:  # Too small to be valid
             return False
             
-        if "//OK" not in html_content:
+        if b"//OK" not in html_content:
             return False
         
-        if "This certificate does not exist in our database" in html_content:
+        if b"This certificate does not exist in our database" in html_content:
             return False
             
         return True
@@ -201,33 +237,42 @@ class CBFCParser:
             safe_filename = self._sanitize_filename(certificate_id)
             html_path = self.html_dir / f"{safe_filename}.html"
             
-            if not html_path.exists():
+            # Open directly instead of checking exists() first, saving a stat call per file
+            try:
+                with open(html_path, 'rb') as f:
+                    raw_content = f.read()
+            except FileNotFoundError:
                 logger.warning(f"HTML file not found for certificate ID: {certificate_id}")
                 return None
-                
-            with open(html_path, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-                
-            if not self.is_html_valid(html_content):
+            
+            # Validate the raw bytes before parsing
+            if not self.is_html_valid(raw_content):
                 logger.warning(f"Invalid HTML content for certificate ID: {certificate_id}")
                 return None
                 
             # Parse the data
-            data_parts = html_content.split('//OK')[1].strip()
-            parsed_data = eval(data_parts)
+            parsed_data = parse_gwt_response(raw_content)
             
             certificate_info = self.extract_main_data(parsed_data)
             
-            for item in parsed_data:
-                if isinstance(item, list):
-                    for subitem in item:
-                        if isinstance(subitem, str):
-                            if 'castCredit' in subitem:
-                                credits = self.parse_credits_section(subitem)
-                                certificate_info.update(credits)
-                            elif 'endorsementHeading' in subitem:
-                                endorsement = self.parse_endorsement_section(subitem)
-                                certificate_info.update(endorsement)
+            # Find the credits and endorsement HTML fragments, stopping once both have been seen
+            credits_html = endorsement_html = None
+            strings = (subitem for item in parsed_data if isinstance(item, list)
+                       for subitem in item if isinstance(subitem, str))
+            for subitem in strings:
+                if credits_html is None and 'castCredit' in subitem:
+                    credits_html = subitem
+                elif endorsement_html is None and 'endorsementHeading' in subitem:
+                    endorsement_html = subitem
+                if credits_html is not None and endorsement_html is not None:
+                    break
+
+            # Parse both fragments as a single document
+            fragments = [fragment for fragment in (credits_html, endorsement_html) if fragment is not None]
+            if fragments:
+                root = lxml_html.fragment_fromstring(''.join(fragments), create_parent='div')
+                certificate_info.update(self.parse_credits_section(root))
+                certificate_info.update(self.parse_endorsement_section(root))
 
             if certificate_info.get('certificate_id') and certificate_info.get('title'):
                 logger.debug(f"Successfully parsed: {certificate_info['title']} (Certificate ID: {certificate_id})")
@@ -240,13 +285,24 @@ class CBFCParser:
                 return certificate_info
             else:
                 logger.debug(f"Incomplete data for certificate ID {certificate_id}")
-                logger.debug(f"Following certificate details extracted: {certificate_info}")
+                # Only build the repr of the extracted details when it will be logged
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Following certificate details extracted: {certificate_info}")
                 return None
 
         except Exception as e:
             logger.error(f"Error parsing certificate ID {certificate_id}: {str(e)}")
             return None
 
+    def iter_html_filenames(self) -> Iterator[str]:
+        """Yield names of the HTML files in the data directory using a single directory scan"""
+        if not self.html_dir.is_dir():
+            return
+        with os.scandir(self.html_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.html') and entry.is_file():
+                    yield entry.name
+
     def get_already_processed_ids(self) -> set:
         """Get the set of certificate IDs that have already been processed from metadata.csv"""
         metadata_path = self.csv_dir / 'metadata.csv'
@@ -292,6 +348,51 @@ class CBFCParser:
         except Exception as e:
             logger.error(f"Error sorting/deduplicating {csv_path}: {str(e)}")
 
+    def save_processed_ids(self):
+        """Compact processed IDs into .processed.json and remove the append-only log"""
+        try:
+            # Write to a temporary file and rename it so an interrupted write never truncates the JSON
+            tmp_file = self.processed_file.with_suffix('.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(orjson.dumps(list(self.processed_ids)))
+            os.replace(tmp_file, self.processed_file)
+            self.processed_log.unlink(missing_ok=True)
+        except Exception as e:
+            logger.error(f"Error saving processed IDs: {str(e)}")
+
+    def extend_csv_header(self, csv_path: Path, fieldnames: List[str]):
+        """Rewrite a CSV file once with an extended header, padding existing rows with empty values"""
+        tmp_path = csv_path.with_suffix('.tmp')
+        with open(csv_path, 'r', newline='', encoding='utf-8') as src, \
+             open(tmp_path, 'w', newline='', encoding='utf-8') as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst)
+            next(reader, None)
+            writer.writerow(fieldnames)
+            width = len(fieldnames)
+            for row in reader:
+                writer.writerow(row + [''] * (width - len(row)))
+        os.replace(tmp_path, csv_path)
+        logger.debug(f"Extended header of {csv_path} to {len(fieldnames)} fields")
+
+    def save_pending_fields(self, fieldnames: List[str]):
+        """Record the extended metadata header before any row using it is written"""
+        tmp_file = self.pending_fields_file.with_suffix('.tmp')
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(fieldnames))
+        os.replace(tmp_file, self.pending_fields_file)
+
+    def apply_pending_fields(self, csv_path: Path):
+        """Extend a CSV header recorded by an earlier run that was killed before extending it"""
+        if not self.pending_fields_file.exists():
+            return
+        with open(self.pending_fields_file, 'rb') as f:
+            fieldnames = orjson.loads(f.read())
+        if csv_path.exists():
+            logger.info(f"Extending header of {csv_path} left by an interrupted run")
+            self.extend_csv_header(csv_path, fieldnames)
+        self.pending_fields_file.unlink()
+
     def process_all_certificates(self) -> Tuple[int, int]:
         """Process all HTML files in the data directory"""
         # Output files
@@ -305,6 +406,9 @@ class CBFCParser:
             'cert_no', 'cert_date', 'final_duration'
         ]
         
+        # Finish extending the header if the previous run was killed before doing so
+        self.apply_pending_fields(metadata_path)
+        
         # Get already processed IDs from metadata.csv and processed.json
         csv_processed_ids = self.get_already_processed_ids()
         self.processed_ids.update(csv_processed_ids)
@@ -328,111 +432,109 @@ class CBFCParser:
         ]
         
         # Get all HTML files
-        html_files = list(self.html_dir.glob('*.html'))
+        html_files = list(self.iter_html_filenames())
         total_files = len(html_files)
         
         # Filter out already processed files
-        files_to_process = [f for f in html_files if self._unsanitize_filename(f.name) not in self.processed_ids]
+        files_to_process = [name for name in html_files if self._unsanitize_filename(name) not in self.processed_ids]
         logger.debug(f"Found {total_files} HTML files, {len(files_to_process)} not yet processed")
         
-        metadata_records = []
-        modification_records = []
+        # Convert sanitized filenames back to original certificate IDs
+        certificate_ids = [self._unsanitize_filename(name) for name in files_to_process]
+
+        metadata_count = 0
+        modification_count = 0
         processed_count = 0
-        
-        # Process each HTML file
-        for html_file in files_to_process:
-            # Convert sanitized filename back to original certificate ID
-            certificate_id = self._unsanitize_filename(html_file.name)
-            
-            result = self.parse_certificate_details(certificate_id)
-            if not result:
-                continue
-            
-            # Clean all text fields
-            for key, value in result.items():
-                if isinstance(value, str):
-                    result[key] = self.clean_text(value)
-            
-            # Separate modifications from metadata
-            modifications = result.pop('modifications', [])
+        new_fields = []
 
-            # Add id field to metadata
-            result['id'] = certificate_id
-            
-            # Update metadata fields with any new fields found in this certificate
-            new_fields = [key for key in result.keys() if key not in metadata_fields]
+        # Rows are written in batches as certificates are parsed; rows written before a new
+        # field appeared are padded when the header is extended once at the end. The wider
+        # header is saved first, so a run killed before the end is repaired on the next start
+        write_metadata_header = not metadata_path.exists()
+        write_modifications_header = not modifications_path.exists()
+        try:
+            with open(metadata_path, 'a', newline='', encoding='utf-8') as metadata_file, \
+                 open(modifications_path, 'a', newline='', encoding='utf-8') as modifications_file, \
+                 open(self.processed_log, 'a', buffering=1) as processed_log, \
+                 ProcessPoolExecutor(max_workers=PARSE_WORKERS) as executor:
+                # Rows are written as lists in header order, which skips DictWriter's per-row key mapping
+                metadata_writer = csv.writer(metadata_file)
+                if write_metadata_header:
+                    metadata_writer.writerow(metadata_fields)
+                modifications_writer = csv.writer(modifications_file)
+                if write_modifications_header:
+                    modifications_writer.writerow(modification_fields)
+
+                metadata_rows = []
+                modification_rows = []
+                batch_ids = []
+
+                def write_batch():
+                    """Write the buffered rows, then record their certificates as processed"""
+                    metadata_writer.writerows(metadata_rows)
+                    modifications_writer.writerows(modification_rows)
+                    metadata_file.flush()
+                    modifications_file.flush()
+                    # Only mark certificates processed once their rows are on disk
+                    self.processed_ids.update(batch_ids)
+                    processed_log.write(''.join(f"{certificate_id}\n" for certificate_id in batch_ids))
+                    metadata_rows.clear()
+                    modification_rows.clear()
+                    batch_ids.clear()
+
+                # Parse the files across worker processes; results come back in input order
+                chunksize = max(1, len(certificate_ids) // (PARSE_WORKERS * 4))
+                results = executor.map(self.parse_certificate_details, certificate_ids, chunksize=chunksize)
+
+                for certificate_id, result in zip(certificate_ids, results):
+                    if not result:
+                        continue
+
+                    # Clean all text fields
+                    for key, value in result.items():
+                        if isinstance(value, str):
+                            result[key] = self.clean_text(value)
+
+                    # Separate modifications from metadata
+                    modifications = result.pop('modifications', [])
+
+                    # Add id field to metadata
+                    result['id'] = certificate_id
+
+                    # Update metadata fields with any new fields found in this certificate
+                    added_fields = [key for key in result.keys() if key not in metadata_fields]
+                    if added_fields:
+                        metadata_fields.extend(added_fields)
+                        new_fields.extend(added_fields)
+                        self.save_pending_fields(metadata_fields)
+
+                    metadata_rows.append([result.get(field, '') for field in metadata_fields])
+                    metadata_count += 1
+
+                    # Handle modifications if present
+                    if modifications:
+                        # Modification fields follow the id, certificate_id and film_name columns in header order
+                        row_prefix = (certificate_id, result.get('certificate_id', ''), result.get('title', ''))
+                        modification_rows.extend(row_prefix + mod for mod in modifications)
+                        modification_count += len(modifications)
+
+                    batch_ids.append(certificate_id)
+                    if len(batch_ids) >= CSV_BATCH_SIZE:
+                        write_batch()
+
+                    processed_count += 1
+                    if processed_count % 100 == 0:
+                        logger.debug(f"Processed {processed_count}/{len(files_to_process)} files")
+
+                write_batch()
+        finally:
             if new_fields:
-                metadata_fields.extend(new_fields)
                 logger.debug(f"Added {len(new_fields)} new fields to metadata: {', '.join(new_fields)}")
-            
-            # Ensure all required fields exist
-            for field in metadata_fields:
-                if field not in result:
-                    result[field] = ''
-            
-            # Write metadata to CSV - if new fields were added, rewrite the entire file
-            if new_fields and metadata_path.exists():
-                # Read existing data
-                existing_data = []
-                with open(metadata_path, 'r', newline='', encoding='utf-8') as f:
-                    reader = csv.DictReader(f)
-                    for row in reader:
-                        # Add empty values for new fields
-                        for field in new_fields:
-                            row[field] = ''
-                        existing_data.append(row)
-                
-                # Write everything back with new header
-                with open(metadata_path, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.DictWriter(f, fieldnames=metadata_fields)
-                    writer.writeheader()
-                    for row in existing_data:
-                        writer.writerow(row)
-                    writer.writerow(result)
-            else:
-                # Normal append operation
-                write_header = not metadata_path.exists()
-                with open(metadata_path, 'a', newline='', encoding='utf-8') as f:
-                    writer = csv.DictWriter(f, fieldnames=metadata_fields)
-                    if write_header:
-                        writer.writeheader()
-                    writer.writerow(result)
-            
-            metadata_records.append(result)
-            
-            # Handle modifications if present
-            if modifications:
-                write_header = not modifications_path.exists()
-                for mod in modifications:
-                    mod_record = {
-                        'id': certificate_id,
-                        'certificate_id': result.get('certificate_id', ''),
-                        'film_name': result.get('title', ''),
-                        **mod
-                    }
-                    
-                    # Ensure all required fields exist
-                    for field in modification_fields:
-                        if field not in mod_record:
-                            mod_record[field] = ''
-                    
-                    with open(modifications_path, 'a', newline='', encoding='utf-8') as modifications_file:
-                        modifications_writer = csv.DictWriter(modifications_file, fieldnames=modification_fields)
-                        if write_header:
-                            modifications_writer.writeheader()
-                            write_header = False
-                        modifications_writer.writerow(mod_record)
-                    modification_records.append(mod_record)
-            
-            # Mark as processed
-            self.processed_ids.add(certificate_id)
-            with open(self.processed_file, 'w') as f:
-                json.dump(list(self.processed_ids), f)
-            
-            processed_count += 1
-            if processed_count % 100 == 0:
-                logger.debug(f"Processed {processed_count}/{len(files_to_process)} files")
-        
+                self.extend_csv_header(metadata_path, metadata_fields)
+                self.pending_fields_file.unlink(missing_ok=True)
+
+        self.save_processed_ids()
+
         # Sort and deduplicate the CSV files
         if metadata_path.exists():
             self.sort_and_deduplicate_csv(str(metadata_path), ['film_name_full', 'certificate_id'])
@@ -440,8 +542,8 @@ class CBFCParser:
         if modifications_path.exists():
             self.sort_and_deduplicate_csv(str(modifications_path), ['film_name', 'certificate_id', 'cut_no'])
         
-        logger.debug(f"Completed processing. Parsed {len(metadata_records)} certificates with {len(modification_records)} modifications.")
-        return len(metadata_records), len(modification_records)
+        logger.debug(f"Completed processing. Parsed {metadata_count} certificates with {modification_count} modifications.")
+        return metadata_count, modification_count
 
 def main():
     parser = CBFCParser()
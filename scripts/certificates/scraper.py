@@ -1,9 +1,14 @@
 import requests
-import json
+import orjson
 import logging
 import urllib3
-from typing import Dict, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from pathlib import Path
+from gwt import parse_gwt_response
 
 # Disable SSL verification warnings
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
@@ -15,12 +20,44 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Number of threads used to check cached HTML files
+CACHE_CHECK_WORKERS = 8
+# Default number of concurrent certificate fetches; also the size of the session's connection pool
+FETCH_WORKERS = 16
+
+# (connect, read) timeout in seconds for each certificate request
+REQUEST_TIMEOUT = (5, 30)
+
+BASE_URL = "https://www.ecinepramaan.gov.in"
+QR_REDIRECT_URL = f"{BASE_URL}/cbfc/cbfc/certificate/qrRedirect/client/QRRedirect"
+
+# Headers copied directly from working curl request; the session ID is added per instance
+_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:134.0) Gecko/20100101 Firefox/134.0',
+    'Content-Type': 'text/x-gwt-rpc; charset=utf-8',
+    # The GWT payload is repetitive text; iter_content transparently decompresses it
+    'Accept-Encoding': 'gzip, deflate',
+    'X-GWT-Permutation': '1',
+    'DTMN_SERVICE': 'TRUE',
+    'DTMN_SESSION_VALIDATION': '0',
+    'Origin': BASE_URL,
+}
+
+# GWT-RPC request body around the certificate ID, kept as bytes so requests sends it without re-encoding
+_PAYLOAD_PREFIX = f'7|0|6|{BASE_URL}/cbfc/cbfc.Cbfc/|A425282E16D492E942BAD73170B377F8|cbfc.certificate.qrRedirect.shared.QRRedirect_Srv|getDefaultValues|java.lang.String/2004016611|'.encode('ascii')
+_PAYLOAD_SUFFIX = b'|1|2|3|4|1|5|6|'
+
 class CBFCScraper:
-    def __init__(self, cookies_dir: str = None):
+    def __init__(self, cookies_dir: str = None, max_workers: int = FETCH_WORKERS):
         self.session = requests.Session()
         # Disable SSL verification
         self.session.verify = False
-        self.base_url = "https://www.ecinepramaan.gov.in"
+        # Keep a pool of keep-alive connections to the single CBFC host and retry transient failures;
+        # POST is retried too since the certificate lookup has no side effects
+        retries = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=frozenset(['POST']))
+        self.max_workers = max_workers
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retries))
+        self.base_url = BASE_URL
         
         # Get the directory containing the cookies and headers files
         cookies_dir = cookies_dir or Path(__file__).parent
@@ -29,32 +66,21 @@ class CBFCScraper:
         
         # Load cookies and headers
         try:
-            with open(cookies_path, 'r') as f:
-                cookies = json.load(f)
-            with open(headers_path, 'r') as f:
-                headers = json.load(f)
+            with open(cookies_path, 'rb') as f:
+                cookies = orjson.loads(f.read())
+            with open(headers_path, 'rb') as f:
+                headers = orjson.loads(f.read())
         except FileNotFoundError:
             raise Exception("Cookies or headers files not found. Please run getCookies.py first.")
         
-        # Headers copied directly from working curl request
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:134.0) Gecko/20100101 Firefox/134.0',
-            'Content-Type': 'text/x-gwt-rpc; charset=utf-8',
-            'X-GWT-Permutation': '1',
-            'DTMN_SERVICE': 'TRUE',
-            'DTMN_SESSIONID': headers['headers']['DTMN_SESSIONID'],
-            'DTMN_SESSION_VALIDATION': '0',
-            'Origin': 'https://www.ecinepramaan.gov.in',
-        })
-        
-        # Disable automatic Accept-Encoding header addition
-        self.session.headers.pop('Accept-Encoding', None)
+        self.session.headers.update(_HEADERS)
+        self.session.headers['DTMN_SESSIONID'] = headers['headers']['DTMN_SESSIONID']
 
         # Set cookies from cookies.json
         for cookie_name, cookie_value in cookies['cookies'].items():
             self.session.cookies.set(cookie_name, cookie_value, domain='ecinepramaan.gov.in')
 
-    def _to_curl(self, url: str, payload: str) -> str:
+    def _to_curl(self, url: str, payload: bytes) -> str:
         """Convert request to curl command for debugging"""
         # Convert cookies to Cookie header
         cookie_header = '; '.join([f"{k}={v}" for k, v in self.session.cookies.items()])
@@ -63,17 +89,17 @@ class CBFCScraper:
             headers['Cookie'] = cookie_header
             
         headers_str = ' '.join([f"-H '{k}: {v}'" for k, v in headers.items()])
-        return f"curl -X POST '{url}' {headers_str} -d '{payload}'"
+        return f"curl -X POST '{url}' {headers_str} -d '{payload.decode('utf-8')}'"
 
-    def is_html_valid(self, html_content: str) -> bool:
-        """Check if HTML content is valid and contains necessary data"""
+    def is_html_valid(self, html_content: bytes) -> bool:
+        """Check if raw HTML content is valid and contains necessary data"""
         if not html_content or len(html_content) < 100:  # Too small to be valid
             return False
             
-        if "//OK" not in html_content:
+        if b"//OK" not in html_content:
             return False
         
-        if "This certificate does not exist in our database" in html_content:
+        if b"This certificate does not exist in our database" in html_content:
             return False
             
         return True
@@ -82,16 +108,14 @@ class CBFCScraper:
         """Sanitize certificate ID for use as filename by replacing problematic characters"""
         return certificate_id.replace('/', '_').replace('=', '_eq_').replace('+', '_plus_')
 
-    def html_exists_and_valid(self, certificate_id: str) -> Tuple[bool, Optional[str]]:
+    def html_exists_and_valid(self, certificate_id: str) -> Tuple[bool, Optional[bytes]]:
         """Check if HTML for the certificate ID exists and is valid"""
         safe_filename = self._sanitize_filename(certificate_id)
         html_path = Path('raw/html') / f"{safe_filename}.html"
         
-        if not html_path.exists():
-            return False, None
-            
         try:
-            with open(html_path, 'r', encoding='utf-8') as f:
+            # Open directly instead of checking exists() first, saving a stat call per ID
+            with open(html_path, 'rb') as f:
                 html_content = f.read()
                 
             if self.is_html_valid(html_content):
@@ -100,50 +124,68 @@ class CBFCScraper:
             else:
                 logger.warning(f"Existing HTML for certificate ID {certificate_id} is invalid")
                 return False, None
+        except FileNotFoundError:
+            return False, None
         except Exception as e:
             logger.error(f"Error reading existing HTML for certificate ID {certificate_id}: {str(e)}")
             return False, None
 
-    def get_certificate_details(self, certificate_id: str) -> Optional[Dict]:
+    def _fetch_raw(self, certificate_id: str, use_cache: bool = True) -> Optional[bytes]:
+        """Return the raw response for a certificate ID, from the HTML cache when valid or else from the server"""
+        # Check if valid HTML already exists, unless the caller has just checked it
+        if use_cache:
+            html_exists, existing_html = self.html_exists_and_valid(certificate_id)
+            if html_exists:
+                return existing_html
+        
+        logger.debug(f"Fetching details for certificate ID: {certificate_id}")
+        
+        url = QR_REDIRECT_URL
+        payload = _PAYLOAD_PREFIX + certificate_id.encode('utf-8') + _PAYLOAD_SUFFIX
+        
+        # Building the curl command walks every header and cookie, so only do it when it will be logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Equivalent curl command:")
+            logger.debug(self._to_curl(url, payload))
+        
+        # Stream the response so error replies can be dropped after the first chunk
+        with self.session.post(url, data=payload, stream=True, timeout=REQUEST_TIMEOUT) as response:
+            response.raise_for_status()
+            chunks = response.iter_content(chunk_size=65536)
+            head = next(chunks, b'')
+            # GWT-RPC replies start with the //OK sentinel on success
+            if b'//OK' not in head[:64]:
+                logger.error(f"Certificate ID {certificate_id}: Response is not a successful GWT-RPC reply")
+                return None
+            # Work on the raw bytes; only the payload after the sentinel is decoded
+            body = head + b''.join(chunks)
+        logger.debug(body)
+        
+        # Check if the response is valid before saving
+        if not self.is_html_valid(body):
+            logger.error(f"Certificate ID {certificate_id}: Invalid HTML response")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Response content: {body[:500]}")  # Log first 500 chars
+            return None
+        
+        # Save the raw HTML response
+        html_dir = Path('raw/html')
+        html_dir.mkdir(parents=True, exist_ok=True)
+        safe_filename = self._sanitize_filename(certificate_id)
+        html_file = html_dir / f"{safe_filename}.html"
+        with open(html_file, 'wb') as f:
+            f.write(body)
+        logger.debug(f"Saved raw HTML for certificate ID: {certificate_id}")
+        return body
+
+    def get_certificate_details(self, certificate_id: str, use_cache: bool = True) -> Optional[Dict]:
         """Fetch and parse certificate details for a given certificate ID"""
         try:
-            # Check if valid HTML already exists
-            html_exists, existing_html = self.html_exists_and_valid(certificate_id)
-            
-            if not html_exists:
-                logger.debug(f"Fetching details for certificate ID: {certificate_id}")
-                
-                url = f"{self.base_url}/cbfc/cbfc/certificate/qrRedirect/client/QRRedirect"
-                payload = f'7|0|6|{self.base_url}/cbfc/cbfc.Cbfc/|A425282E16D492E942BAD73170B377F8|cbfc.certificate.qrRedirect.shared.QRRedirect_Srv|getDefaultValues|java.lang.String/2004016611|{certificate_id}|1|2|3|4|1|5|6|'
-                
-                logger.debug("Equivalent curl command:")
-                logger.debug(self._to_curl(url, payload))
-                
-                response = self.session.post(url, data=payload)
-                response.raise_for_status()
-                logger.debug(response.text)
-                
-                # Check if the response is valid before saving
-                if not self.is_html_valid(response.text):
-                    logger.error(f"Certificate ID {certificate_id}: Invalid HTML response")
-                    logger.debug(f"Response content: {response.text[:500]}")  # Log first 500 chars
-                    return None
-                
-                # Save the raw HTML response
-                html_dir = Path('raw/html')
-                html_dir.mkdir(parents=True, exist_ok=True)
-                safe_filename = self._sanitize_filename(certificate_id)
-                html_file = html_dir / f"{safe_filename}.html"
-                with open(html_file, 'w', encoding='utf-8') as f:
-                    f.write(response.text)
-                logger.debug(f"Saved raw HTML for certificate ID: {certificate_id}")
-                
-                data_parts = response.text.split('//OK')[1].strip()
-            else:
-                # Use existing valid HTML
-                data_parts = existing_html.split('//OK')[1].strip()
+            body = self._fetch_raw(certificate_id, use_cache)
+            if body is None:
+                return None
             
-            parsed_data = eval(data_parts)
+            parsed_data = parse_gwt_response(body)
 
             if parsed_data:
                 logger.debug(f"Successfully scraped {certificate_id}")
@@ -155,6 +197,39 @@ class CBFCScraper:
         except Exception as e:
             logger.error(f"Error processing certificate ID {certificate_id}: {str(e)}")
             return None
+
+    def get_many(self, certificate_ids: Iterable[str], use_cache: bool = True) -> List[Optional[str]]:
+        """Fetch certificate details for several IDs concurrently over the pooled session"""
+        results = []
+        # Submit lazily so only a bounded number of fetches are queued at any time; results stay in input order
+        max_in_flight = self.max_workers * 2
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = deque()
+            for certificate_id in certificate_ids:
+                if len(in_flight) >= max_in_flight:
+                    results.append(in_flight.popleft().result())
+                in_flight.append(executor.submit(self.get_certificate_details, certificate_id, use_cache))
+            results.extend(future.result() for future in in_flight)
+        return results
+
+    def process_certificates(self, certificate_ids: Iterable[str]) -> Set[str]:
+        """Fetch (or reuse cached HTML for) each certificate ID and return the set of valid IDs"""
+        certificate_ids = list(certificate_ids)
+        
+        # Check cached HTML files concurrently; the reads are independent and release the GIL
+        with ThreadPoolExecutor(max_workers=CACHE_CHECK_WORKERS) as executor:
+            cached = list(executor.map(lambda cert_id: self.html_exists_and_valid(cert_id)[0], certificate_ids))
+        
+        valid_ids = {cert_id for cert_id, html_exists in zip(certificate_ids, cached) if html_exists}
+        missing_ids = [cert_id for cert_id, html_exists in zip(certificate_ids, cached) if not html_exists]
+        
+        # Fetch the remaining certificates concurrently; their cache files were just found missing
+        # or invalid, so skip reading them a second time
+        for certificate_id, result in zip(missing_ids, self.get_many(missing_ids, use_cache=False)):
+            if result:
+                valid_ids.add(certificate_id)
+        return valid_ids
+
 def main():
     scraper = CBFCScraper()
     